@@ -0,0 +1,60 @@
+"""Walker's alias method for O(1) sampling from discrete distributions."""
+from numba import njit
+import numpy as np
+
+# Acceptance probabilities are stored as uint16 fixed point numbers
+Q_SCALE = 65535
+
+# Concrete signature, compiled once at import and cached on disk
+BUILD_ALIAS_SIGNATURE = 'void(float64[::1], int32[::1], uint16[::1])'
+
+
+@njit(BUILD_ALIAS_SIGNATURE, nogil=True, cache=True)
+def build_alias(weights, J, q):
+    """Normalizes weights and builds their alias table with Vose's algorithm.
+
+    Normalization is fused into the scaling step of Vose's algorithm, which
+    operates in place on `weights`. Sampling draws `i` uniformly from
+    `range(k)` and keeps it with probability `q[i] / Q_SCALE`, otherwise
+    jumps to its alias `J[i]`.
+
+    :param weights: Unnormalized float64 weights of `k` outcomes,
+                    overwritten
+    :param J: Output aliases, int32[k]
+    :param q: Output acceptance probabilities scaled by `Q_SCALE`,
+              uint16[k]
+    """
+    k = len(weights)
+    scale = k / weights.sum()
+
+    # Small outcomes are stacked from the front, large from the back
+    stack = np.empty(k, np.int32)
+    num_small, num_large = 0, 0
+
+    for i in range(k):
+        weights[i] *= scale
+        J[i] = i
+        q[i] = Q_SCALE
+
+        if weights[i] < 1.0:
+            stack[num_small] = i
+            num_small += 1
+        else:
+            num_large += 1
+            stack[k - num_large] = i
+
+    while num_small and num_large:
+        num_small -= 1
+        less = stack[num_small]
+        more = stack[k - num_large]
+
+        q[less] = np.uint16(round(weights[less] * Q_SCALE))
+        J[less] = more
+
+        weights[more] = weights[more] + weights[less] - 1.0
+        if weights[more] < 1.0:
+            num_large -= 1
+            stack[num_small] = more
+            num_small += 1
+
+    # Leftovers are only off by rounding errors, they keep q = 1, J = self
@@ -0,0 +1,116 @@
+"""Numba compiled transition probabilities kernel."""
+from numba import njit
+
+from ._alias import build_alias
+
+# Relation of a node to the current source
+OUTWARD, SHARED, BACKWARDS = 0, 1, 2
+
+# Concrete signature, compiled once at import and cached on disk
+PRECOMPUTE_PROBABILITIES_SIGNATURE = (
+    'void(int64[::1], int32[::1], float32[::1], float64[::1], float64[::1], '
+    'boolean, int64[::1], int32[::1], uint16[::1], int32[::1], uint16[::1], '
+    'int64, int64, uint8[::1], float64[::1])'
+)
+
+
+@njit(inline='always')
+def mark_source(indptr, indices, source, source_relation):
+    """Marks the neighbors of `source` as `SHARED` and itself `BACKWARDS`."""
+    for edge in range(indptr[source], indptr[source + 1]):
+        source_relation[indices[edge]] = SHARED
+    source_relation[source] = BACKWARDS
+
+
+@njit(inline='always')
+def unmark_source(indptr, indices, source, source_relation):
+    """Resets the relations set by `mark_source` to `OUTWARD`."""
+    for edge in range(indptr[source], indptr[source + 1]):
+        source_relation[indices[edge]] = OUTWARD
+    source_relation[source] = OUTWARD
+
+
+@njit(inline='always')
+def transition_weights(indptr, indices, weights, inv_p, inv_q, current_node,
+                       source_relation, scratch):
+    """Unnormalized weights of moving from `current_node` to its neighbors.
+
+    The source the walk arrived from must be marked in `source_relation`.
+
+    :return: View of `scratch` holding the weights
+    """
+    current_start = indptr[current_node]
+    current_end = indptr[current_node + 1]
+
+    # Backwards, neighbors connected to the source and the rest
+    unnormalized_weights = scratch[:current_end - current_start]
+    for i in range(current_end - current_start):
+        relation = source_relation[indices[current_start + i]]
+        if relation == BACKWARDS:
+            factor = inv_p[current_node]
+        elif relation == SHARED:
+            factor = 1.0
+        else:
+            factor = inv_q[current_node]
+        unnormalized_weights[i] = weights[current_start + i] * factor
+
+    return unnormalized_weights
+
+
+@njit(PRECOMPUTE_PROBABILITIES_SIGNATURE, nogil=True, cache=True)
+def precompute_probabilities(indptr, indices, weights, inv_p, inv_q,
+                             transitions, trans_offsets, trans_alias_J,
+                             trans_alias_q, first_travel_alias_J,
+                             first_travel_alias_q, first_source, last_source,
+                             source_relation, scratch):
+    """Builds the alias tables of the sources in `[first_source, last_source)`.
+
+    Only the table slices owned by these sources are written, so disjoint
+    source ranges can be processed concurrently.
+
+    :param inv_p: Inverse return parameter of every node
+    :param inv_q: Inverse inout parameter of every node
+    :param transitions: Whether to build the (source, current) tables too,
+                        otherwise only the first travel tables are built
+    :param source_relation: All `OUTWARD` buffer of size N, left unchanged
+    :param scratch: Buffer of at least the maximal degree
+    """
+    for source in range(first_source, last_source):
+        source_start, source_end = indptr[source], indptr[source + 1]
+
+        # Skip dead end nodes
+        if source_start == source_end:
+            continue
+
+        # First travel probabilities
+        first_travel_weights = scratch[:source_end - source_start]
+        for i in range(source_end - source_start):
+            first_travel_weights[i] = weights[source_start + i]
+        build_alias(first_travel_weights,
+                    first_travel_alias_J[source_start:source_end],
+                    first_travel_alias_q[source_start:source_end])
+
+        if not transitions:
+            continue
+
+        mark_source(indptr, indices, source, source_relation)
+
+        for edge in range(source_start, source_end):
+            trans_start = trans_offsets[edge]
+            trans_end = trans_offsets[edge + 1]
+
+            # Skip edges into dead end nodes
+            if trans_start == trans_end:
+                continue
+
+            unnormalized_weights = transition_weights(
+                indptr, indices, weights, inv_p, inv_q, indices[edge],
+                source_relation, scratch
+            )
+
+            # Normalize and build the alias table
+            build_alias(unnormalized_weights,
+                        trans_alias_J[trans_start:trans_end],
+                        trans_alias_q[trans_start:trans_end])
+
+        unmark_source(indptr, indices, source, source_relation)
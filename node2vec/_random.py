@@ -0,0 +1,54 @@
+"""Numba compiled xorshift64* random number generator.
+
+The generator state is a plain uint64 owned by the calling kernel, so
+threads draw numbers without any shared state or locking.
+"""
+import numpy as np
+from numba import njit
+
+_GOLDEN_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+_MULTIPLIER = np.uint64(0x2545F4914F6CDD1D)
+_LOW_32_BITS = np.uint64(0xFFFFFFFF)
+
+
+@njit(inline='always')
+def seed_state(seed):
+    """Derives a non zero generator state from a seed with splitmix64."""
+    z = np.uint64(seed) + _GOLDEN_GAMMA
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    z ^= z >> np.uint64(31)
+    return z if z != 0 else _GOLDEN_GAMMA
+
+
+@njit(inline='always')
+def next_state(state):
+    """Advances the generator state."""
+    state ^= state << np.uint64(13)
+    state ^= state >> np.uint64(7)
+    state ^= state << np.uint64(17)
+    return state
+
+
+@njit(inline='always')
+def random_bits(state):
+    """64 random bits of the generator state."""
+    return state * _MULTIPLIER
+
+
+@njit(inline='always')
+def high_below(bits, n):
+    """Maps the high 32 bits uniformly onto `range(n)`, for n < 2 ** 32."""
+    return np.int64(((bits >> np.uint64(32)) * np.uint64(n)) >> np.uint64(32))
+
+
+@njit(inline='always')
+def low_below(bits, n):
+    """Maps the low 32 bits uniformly onto `range(n)`, for n < 2 ** 32."""
+    return np.int64(((bits & _LOW_32_BITS) * np.uint64(n)) >> np.uint64(32))
+
+
+@njit(inline='always')
+def low_uniform(bits):
+    """Maps the low 32 bits uniformly onto [0, 1)."""
+    return np.float64(bits & _LOW_32_BITS) * (1.0 / 4294967296.0)
@@ -0,0 +1,154 @@
+"""Numba compiled random walk kernel."""
+import numpy as np
+from numba import njit
+
+from ._alias import Q_SCALE
+from ._precompute_kernel import mark_source, transition_weights, \
+    unmark_source
+from ._random import high_below, low_below, low_uniform, next_state, \
+    random_bits, seed_state
+
+# Number of walks advanced together, one step each, by a thread
+BATCH_SIZE = 32
+
+# Concrete signature, compiled once at import and cached on disk
+GENERATE_WALKS_SIGNATURE = (
+    'void(int64[::1], int32[::1], float32[::1], float64[::1], float64[::1], '
+    'int64[::1], int32[::1], uint16[::1], int32[::1], uint16[::1], boolean, '
+    'boolean, int32[::1], int32[::1], int32[::1], int64, uint8[::1], '
+    'float64[::1], int32[:, ::1])'
+)
+
+
+@njit(GENERATE_WALKS_SIGNATURE, nogil=True, cache=True, fastmath=True)
+def generate_walks(indptr, indices, weights, inv_p, inv_q, trans_offsets,
+                   trans_alias_J, trans_alias_q, first_travel_alias_J,
+                   first_travel_alias_q, uniform, precomputed, walk_length,
+                   num_walks, rounds, seed, source_relation, scratch, walks):
+    """Fills `walks` with one walk from every node for each given round.
+
+    Transition and first travel probabilities are alias tables with
+    fixed point acceptance probabilities, so a step is one xorshift64* draw,
+    two array loads and an integer compare. Without precomputed transition
+    tables, a step computes the weights of the current node's neighbors
+    and samples their prefix sums instead, in O(degree) time.
+
+    Walks are processed in batches of `BATCH_SIZE` which are advanced in
+    lock step: each step visits every walk of the batch before the next
+    step starts, so the independent neighbor lookups of the batch overlap
+    instead of stalling on one walk at a time.
+
+    :param inv_p: Inverse return parameter of every node
+    :param inv_q: Inverse inout parameter of every node
+    :param uniform: Whether every transition is uniform over the neighbors,
+                    the alias tables are then ignored and may be empty
+    :param precomputed: Whether the (source, current) alias tables exist,
+                        otherwise they may be empty
+    :param walk_length: Walk length of every node
+    :param num_walks: Number of walks of every node
+    :param rounds: Indices of the walk rounds to generate
+    :param seed: Seed of the random number generator
+    :param source_relation: All `OUTWARD` buffer of size N, left unchanged
+    :param scratch: Buffer of at least the maximal degree
+    :param walks: Output matrix of shape `(len(rounds) * N, L)` with
+                  `L >= walk_length.max()`, cells past the end of a walk
+                  are set to -1 and rows of skipped walks entirely to -1
+    """
+    state = seed_state(seed)
+
+    num_nodes = len(indptr) - 1
+    total_walks = len(rounds) * num_nodes
+
+    # Shuffle the nodes of each round (Fisher-Yates)
+    start_nodes = np.empty(total_walks, np.int32)
+    for i in range(len(rounds)):
+        shuffled_nodes = start_nodes[i * num_nodes:(i + 1) * num_nodes]
+        for j in range(num_nodes):
+            shuffled_nodes[j] = j
+        for j in range(num_nodes - 1, 0, -1):
+            state = next_state(state)
+            k = high_below(random_bits(state), j + 1)
+            shuffled_nodes[j], shuffled_nodes[k] = \
+                shuffled_nodes[k], shuffled_nodes[j]
+
+    num_batches = (total_walks + BATCH_SIZE - 1) // BATCH_SIZE
+    for batch in range(num_batches):
+        first_walk = batch * BATCH_SIZE
+        batch_size = min(BATCH_SIZE, total_walks - first_walk)
+
+        # State of the walks in the batch, `edge` is the last traversed edge
+        previous_node = np.empty(batch_size, np.int32)
+        current_node = np.empty(batch_size, np.int32)
+        edge = np.full(batch_size, -1, np.int64)
+        length = np.zeros(batch_size, np.int32)
+
+        max_length = 0
+        for j in range(batch_size):
+            w = first_walk + j
+            source = start_nodes[w]
+            walks[w, :] = -1
+
+            # Skip nodes with specific num_walks
+            if num_walks[source] <= rounds[w // num_nodes]:
+                continue
+
+            walks[w, 0] = source
+            current_node[j] = source
+            length[j] = walk_length[source]
+            max_length = max(max_length, length[j])
+
+        for step in range(1, max_length):
+            for j in range(batch_size):
+                # Finished walks
+                if step >= length[j]:
+                    continue
+
+                start = indptr[current_node[j]]
+                end = indptr[current_node[j] + 1]
+
+                # Skip dead end nodes
+                if start == end:
+                    length[j] = 0
+                    continue
+
+                # One draw: high bits pick the bucket, low bits accept it
+                state = next_state(state)
+                bits = random_bits(state)
+
+                if uniform:
+                    i = high_below(bits, end - start)
+                elif edge[j] < 0 or precomputed:
+                    if edge[j] < 0:  # For the first step
+                        J = first_travel_alias_J[start:end]
+                        q = first_travel_alias_q[start:end]
+                    else:
+                        trans_start = trans_offsets[edge[j]]
+                        trans_end = trans_offsets[edge[j] + 1]
+                        J = trans_alias_J[trans_start:trans_end]
+                        q = trans_alias_q[trans_start:trans_end]
+
+                    i = high_below(bits, end - start)
+                    if low_below(bits, Q_SCALE) >= q[i]:
+                        i = J[i]
+                else:
+                    mark_source(indptr, indices, previous_node[j],
+                                source_relation)
+                    cumulative = transition_weights(
+                        indptr, indices, weights, inv_p, inv_q,
+                        current_node[j], source_relation, scratch
+                    )
+                    unmark_source(indptr, indices, previous_node[j],
+                                  source_relation)
+
+                    for k in range(1, end - start):
+                        cumulative[k] += cumulative[k - 1]
+                    i = min(np.searchsorted(cumulative,
+                                            low_uniform(bits) *
+                                            cumulative[-1],
+                                            side='right'),
+                            end - start - 1)
+
+                edge[j] = start + i
+                previous_node[j] = current_node[j]
+                current_node[j] = indices[edge[j]]
+                walks[first_walk + j, step] = current_node[j]
@@ -1,7 +1,7 @@
 """Implementation of the Node2vec algorithm."""
-import os
-from collections import defaultdict
-from typing import Optional
+import sys
+import warnings
+from typing import Iterator, Optional
 
 import numpy as np
 import networkx as nx
@@ -9,20 +9,19 @@ import gensim
 from joblib import Parallel, delayed
 from tqdm import tqdm
 
-from .parallel import parallel_generate_walks
+from .parallel import parallel_generate_walks, \
+    parallel_precompute_probabilities
 
 
 class Node2Vec:
     """Implements Node2vec algorithm."""
 
-    FIRST_TRAVEL_KEY = 'first_travel_key'
-    PROBABILITIES_KEY = 'probabilities'
-    NEIGHBORS_KEY = 'neighbors'
     WEIGHT_KEY = 'weight'
     NUM_WALKS_KEY = 'num_walks'
     WALK_LENGTH_KEY = 'walk_length'
     P_KEY = 'p'
     Q_KEY = 'q'
+    MIN_WALKS_PER_WORKER = 10000
 
     def __init__(
         self,
@@ -36,11 +35,15 @@ class Node2Vec:
         workers: int = 1,
         sampling_strategy: Optional[dict] = None,
         quiet: bool = False,
-        temp_folder: Optional[str] = None
+        temp_folder: Optional[str] = None,
+        precompute: bool = True
     ):
         """Initiates Node2Vec.
 
-        Pre-computes walking probabilities and generates the walks.
+        Pre-computes walking probabilities, walks are generated on demand
+        whenever `self.walks` is iterated. `self.walks` is not a list, every
+        iteration yields new walks, use `list(self.walks)` to keep a fixed
+        set of walks.
 
         :param graph: Input graph
         :param dimensions: Embedding dimensions (default: 128)
@@ -56,9 +59,13 @@ class Node2Vec:
                                   and `walk_length`. Use these keys exactly.
                                   If not set, will use the global ones which
                                   were passed on the object initialization
-        :param temp_folder: Path to folder with enough space to hold the memory
-                            map of self.d_graph (for big graphs); to be passed
-                            `joblib.Parallel.temp_folder`
+        :param temp_folder: Deprecated and ignored, the workers share the
+                            transition probabilities in memory
+        :param precompute: Whether to pre-compute the transition
+                           probabilities of every (source, current) pair.
+                           Otherwise they are computed on the fly during
+                           the walks, trading walk speed for memory on big
+                           graphs (default: True)
         """
         self.graph = graph
         self.dimensions = dimensions
@@ -69,137 +76,235 @@ class Node2Vec:
         self.weight_key = weight_key
         self.workers = workers
         self.quiet = quiet
-        self.d_graph = defaultdict(dict)
+        self.precompute = precompute
 
         if sampling_strategy is None:
             self.sampling_strategy = {}
         else:
             self.sampling_strategy = sampling_strategy
 
-        self.temp_folder, self.require = None, None
-        if temp_folder:
-            if not os.path.isdir(temp_folder):
-                raise NotADirectoryError(
-                    "temp_folder does not exist or "
-                    "is not a directory. ({})".format(temp_folder)
-                )
-
-            self.temp_folder = temp_folder
-            self.require = "sharedmem"
+        if temp_folder is not None:
+            warnings.warn(
+                "temp_folder is deprecated and ignored, the workers share "
+                "the transition probabilities in memory",
+                DeprecationWarning
+            )
+
+        self._build_csr()
+
+        # Without return / inout bias and with equal edge weights every
+        # transition is uniform over the neighbors and needs no precomputed
+        # probabilities
+        weights = self.neighbors_weights
+        self._uniform = (
+            self.p == 1 and self.q == 1
+            and not any(self.P_KEY in strategy or self.Q_KEY in strategy
+                        for strategy in self.sampling_strategy.values())
+            and (len(weights) == 0 or weights.min() == weights.max())
+        )
 
         self._precompute_probabilities()
-        self.walks = self._generate_walks()
+        self.walks = _WalkCorpus(self)
+
+    def _build_csr(self):
+        """Stores the graph as CSR arrays over node ids 0..N-1.
+
+        Node ids follow the order of `graph.nodes()`, `self._inv_label` maps
+        them back to the original node labels and `self._tok` to their
+        tokens. The neighbors of each node are sorted by id.
+        """
+        self._inv_label = list(self.graph.nodes())
+        self._node_ids = {node: i for i, node in enumerate(self._inv_label)}
+
+        # Interned string tokens of the nodes, as fed to gensim
+        self._tok = [sys.intern(str(label)) for label in self._inv_label]
+
+        num_nodes = len(self._inv_label)
+        num_edges = sum(len(nbrs) for nbrs in self.graph.adj.values())
+
+        # Node ids are int32, edge indices and offsets int64
+        if num_nodes > np.iinfo(np.int32).max:
+            raise ValueError('graph must have less than 2**31 nodes')
+
+        self.neighbors_offsets = np.empty(num_nodes + 1, dtype=np.int64)
+        self.neighbors_flat = np.empty(num_edges, dtype=np.int32)
+        self.neighbors_weights = np.empty(num_edges, dtype=np.float32)
+
+        offsets = self.neighbors_offsets
+        offsets[0] = 0
+        edge = 0
+        for node, nbrs in self.graph.adj.items():
+            for neighbor, attributes in nbrs.items():
+                self.neighbors_flat[edge] = self._node_ids[neighbor]
+                self.neighbors_weights[edge] = attributes.get(self.weight_key,
+                                                              1)
+                edge += 1
+            offsets[self._node_ids[node] + 1] = edge
+
+        # Sort the neighbors of every node by id, the edge index then
+        # identifies both a (source, current) pair and its bucket offsets
+        rows = np.repeat(np.arange(num_nodes, dtype=np.int32),
+                         np.diff(offsets))
+        order = np.lexsort((self.neighbors_flat, rows))
+        self.neighbors_flat = self.neighbors_flat[order]
+        self.neighbors_weights = self.neighbors_weights[order]
 
     def _precompute_probabilities(self):
-        """Pre-computes transition probabilities for each node."""
-        d_graph = self.d_graph
-        first_travel_done = set()
-
-        nodes_generator = self.graph.nodes() if self.quiet \
-            else tqdm(self.graph.nodes(),
-                      desc='Computing transition probabilities')
-
-        for source in nodes_generator:
-
-            # Init probabilities dict for first travel
-            if self.PROBABILITIES_KEY not in d_graph[source]:
-                d_graph[source][self.PROBABILITIES_KEY] = dict()
-
-            for current_node in self.graph.neighbors(source):
-
-                # Init probabilities dict
-                if self.PROBABILITIES_KEY not in d_graph[current_node]:
-                    d_graph[current_node][self.PROBABILITIES_KEY] = dict()
-
-                unnormalized_weights = list()
-                first_travel_weights = list()
-                d_neighbors = list()
-
-                # Calculate unnormalized weights
-                for destination in self.graph.neighbors(current_node):
-
-                    p = (
-                        self.sampling_strategy[current_node].get(self.P_KEY,
-                                                                 self.p)
-                        if current_node in self.sampling_strategy else self.p
-                    )
-                    q = (
-                        self.sampling_strategy[current_node].get(self.Q_KEY,
-                                                                 self.q)
-                        if current_node in self.sampling_strategy else self.q
-                    )
-
-                    if destination == source:
-                        # Backwards probability
-                        ss_weight = self.graph[current_node][destination].get(
-                            self.weight_key, 1
-                        ) * 1 / p
-                    elif destination in self.graph[source]:
-                        # If the neighbor is connected to the source
-                        ss_weight = self.graph[current_node][destination].get(
-                            self.weight_key, 1
-                        )
-                    else:
-                        ss_weight = self.graph[current_node][destination].get(
-                            self.weight_key, 1
-                        ) * 1 / q
-
-                    # Assign the unnormalized sampling strategy weight,
-                    # normalize during random walk
-                    unnormalized_weights.append(ss_weight)
-                    if current_node not in first_travel_done:
-                        first_travel_weights.append(
-                            self.graph[current_node][destination].get(
-                                self.weight_key, 1
-                            )
-                        )
-                    d_neighbors.append(destination)
-
-                # Normalize
-                unnormalized_weights = np.array(unnormalized_weights)
-                d_graph[current_node][self.PROBABILITIES_KEY][
-                    source] = unnormalized_weights / unnormalized_weights.sum()
-
-                if current_node not in first_travel_done:
-                    unnormalized_weights = np.array(first_travel_weights)
-                    d_graph[current_node][self.FIRST_TRAVEL_KEY] = (
-                        unnormalized_weights / unnormalized_weights.sum()
-                    )
-                    first_travel_done.add(current_node)
-
-                # Save neighbors
-                d_graph[current_node][self.NEIGHBORS_KEY] = d_neighbors
-
-    def _generate_walks(self) -> list:
+        """Pre-computes transition probabilities for each node.
+
+        The probabilities of moving from `current` after arriving over edge
+        `e = (source, current)` are stored as an alias table in
+        `self.trans_alias_J[self.trans_offsets[e]:self.trans_offsets[e + 1]]`
+        and `self.trans_alias_q[...]`, aligned with the neighbors of
+        `current`. The first travel alias tables `self.first_travel_alias_J` and
+        `self.first_travel_alias_q` are aligned with `self.neighbors_flat`.
+
+        Uniform transitions keep all the tables empty, transitions computed
+        on the fly keep the (source, current) tables empty.
+        """
+        indptr = self.neighbors_offsets
+        indices = self.neighbors_flat
+        weights = self.neighbors_weights
+        degrees = np.diff(indptr)
+
+        # Node specific return and inout parameters
+        self._inv_p = np.full(len(degrees), 1 / self.p)
+        self._inv_q = np.full(len(degrees), 1 / self.q)
+        for node, strategy in self.sampling_strategy.items():
+            node_id = self._node_ids.get(node)
+
+            # Ignore strategies of nodes not in the graph
+            if node_id is None:
+                continue
+
+            self._inv_p[node_id] = 1 / strategy.get(self.P_KEY, self.p)
+            self._inv_q[node_id] = 1 / strategy.get(self.Q_KEY, self.q)
+
+        if self._uniform:
+            self.trans_offsets = np.zeros(1, dtype=np.int64)
+            self.trans_alias_J = np.empty(0, dtype=np.int32)
+            self.trans_alias_q = np.empty(0, dtype=np.uint16)
+            self.first_travel_alias_J = np.empty(0, dtype=np.int32)
+            self.first_travel_alias_q = np.empty(0, dtype=np.uint16)
+            return
+
+        if self.precompute:
+            self.trans_offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+            np.cumsum(degrees[indices], out=self.trans_offsets[1:])
+        else:
+            self.trans_offsets = np.zeros(1, dtype=np.int64)
+        self.trans_alias_J = np.empty(self.trans_offsets[-1], dtype=np.int32)
+        self.trans_alias_q = np.empty(self.trans_offsets[-1], dtype=np.uint16)
+        self.first_travel_alias_J = np.empty(len(indices), dtype=np.int32)
+        self.first_travel_alias_q = np.empty(len(indices), dtype=np.uint16)
+
+        # Split the sources for each worker, balanced by the size of their
+        # alias tables
+        work = self.trans_offsets[indptr] if self.precompute else indptr
+        boundaries = np.searchsorted(
+            work, np.linspace(0, work[-1], self.workers + 1)
+        )
+        boundaries[0], boundaries[-1] = 0, len(degrees)
+        source_ranges = [
+            (first_source, last_source) for first_source, last_source
+            in zip(boundaries[:-1], boundaries[1:])
+            if first_source < last_source
+        ]
+
+        # Workers are threads filling the tables of their own sources, the
+        # kernel releases the GIL
+        Parallel(n_jobs=self.workers, require='sharedmem')(
+            delayed(parallel_precompute_probabilities)(
+                indptr,
+                indices,
+                weights,
+                self._inv_p,
+                self._inv_q,
+                self.precompute,
+                self.trans_offsets,
+                self.trans_alias_J,
+                self.trans_alias_q,
+                self.first_travel_alias_J,
+                self.first_travel_alias_q,
+                first_source,
+                last_source,
+                idx,
+                self.quiet
+            ) for
+            idx, (first_source, last_source)
+            in enumerate(source_ranges, 1))
+
+    def _generate_walks(self) -> Iterator[np.ndarray]:
         """Generates the random walks which will be used as the skip-gram input.
 
-        :return: List of walks. Each walk is a list of nodes.
+        Walks are generated in batches of whole rounds, each worker of a
+        reused pool generating about `MIN_WALKS_PER_WORKER` walks or more.
+
+        :return: Iterator over walks matrices of node ids, one row per walk.
+                 Cells past the end of a walk are -1, rows of skipped walks
+                 are entirely -1
         """
-        flatten = lambda l: [item for sublist in l for item in sublist]  # noqa: E501,E731
-
-        # Split num_walks for each worker
-        num_walks_lists = np.array_split(range(self.num_walks), self.workers)
-
-        walk_results = Parallel(n_jobs=self.workers,
-                                temp_folder=self.temp_folder,
-                                require=self.require)(
-            delayed(parallel_generate_walks)(self.d_graph,
-                                             self.walk_length,
-                                             len(num_walks),
-                                             idx,
-                                             self.sampling_strategy,
-                                             self.NUM_WALKS_KEY,
-                                             self.WALK_LENGTH_KEY,
-                                             self.NEIGHBORS_KEY,
-                                             self.PROBABILITIES_KEY,
-                                             self.FIRST_TRAVEL_KEY,
-                                             self.quiet) for
-            idx, num_walks
-            in enumerate(num_walks_lists, 1))
-
-        walks = flatten(walk_results)
-
-        return walks
+        # Node specific walk lengths and number of walks
+        num_nodes = len(self._inv_label)
+        walk_length = np.full(num_nodes, self.walk_length, dtype=np.int32)
+        num_walks = np.full(num_nodes, self.num_walks, dtype=np.int32)
+        for node, strategy in self.sampling_strategy.items():
+            node_id = self._node_ids.get(node)
+
+            # Ignore strategies of nodes not in the graph
+            if node_id is None:
+                continue
+
+            walk_length[node_id] = strategy.get(self.WALK_LENGTH_KEY,
+                                                self.walk_length)
+            num_walks[node_id] = strategy.get(self.NUM_WALKS_KEY,
+                                              self.num_walks)
+
+        # Small graphs get several rounds per worker so that every batch is
+        # worth dispatching to the pool
+        worker_rounds = max(1, self.MIN_WALKS_PER_WORKER // max(1, num_nodes))
+        batch_rounds = self.workers * worker_rounds
+
+        walks = np.empty((batch_rounds * num_nodes,
+                          max(1, walk_length.max(initial=0))), dtype=np.int32)
+
+        # Both are closed even when the consumer stops iterating early
+        with tqdm(total=self.num_walks,
+                  desc='Generating walks',
+                  disable=self.quiet) as pbar, \
+                Parallel(n_jobs=self.workers, require='sharedmem') as parallel:
+            for first_round in range(0, self.num_walks, batch_rounds):
+                rounds = np.arange(first_round,
+                                   min(first_round + batch_rounds,
+                                       self.num_walks),
+                                   dtype=np.int32)
+
+                # Workers are threads filling the rows of their own rounds,
+                # the walk kernel releases the GIL
+                parallel(
+                    delayed(parallel_generate_walks)(
+                        self.neighbors_offsets,
+                        self.neighbors_flat,
+                        self.neighbors_weights,
+                        self._inv_p,
+                        self._inv_q,
+                        self.trans_offsets,
+                        self.trans_alias_J,
+                        self.trans_alias_q,
+                        self.first_travel_alias_J,
+                        self.first_travel_alias_q,
+                        self._uniform,
+                        self.precompute,
+                        walk_length,
+                        num_walks,
+                        rounds[i:i + worker_rounds],
+                        walks[i * num_nodes:(i + worker_rounds) * num_nodes],
+                        np.random.randint(2 ** 31))
+                    for i in range(0, len(rounds), worker_rounds))
+
+                pbar.update(len(rounds))
+
+                yield walks[:len(rounds) * num_nodes]
 
     def fit(self, **skip_gram_params) -> gensim.models.Word2Vec:
         """Creates the embeddings using gensim's Word2Vec.
@@ -217,3 +322,30 @@ class Node2Vec:
             skip_gram_params['size'] = self.dimensions
 
         return gensim.models.Word2Vec(self.walks, **skip_gram_params)
+
+
+class _WalkCorpus:
+    """Walks of a Node2Vec instance as lists of node labels, for gensim.
+
+    Every iteration generates fresh walks batch by batch, so walks are not
+    kept in memory between iterations (e.g. the epochs of Word2Vec).
+    """
+
+    def __init__(self, node2vec: Node2Vec):
+        """Inits _WalkCorpus.
+
+        :param node2vec: Node2Vec instance with precomputed probabilities
+        """
+        self.node2vec = node2vec
+
+    def __iter__(self):
+        """Iterates over new walks, skipping the empty ones."""
+        tok = self.node2vec._tok
+        for walks in self.node2vec._generate_walks():
+            for walk in walks:
+                walk = walk.tolist()
+                if walk[-1] < 0:
+                    if walk[0] < 0:
+                        continue
+                    walk = walk[:walk.index(-1)]
+                yield [tok[node] for node in walk]
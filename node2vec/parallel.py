@@ -1,88 +1,86 @@
 """Implementation of random walker."""
-import random
 import numpy as np
 from tqdm import tqdm
 
-
-def parallel_generate_walks(
-    d_graph: dict,
-    global_walk_length: int,
-    num_walks: int,
+from ._precompute_kernel import precompute_probabilities
+from ._walk_kernel import generate_walks
+
+# Number of sources between two updates of the precompute progress bar
+PROGRESS_INTERVAL = 10000
+
+
+def parallel_precompute_probabilities(
+    indptr: np.ndarray,
+    indices: np.ndarray,
+    weights: np.ndarray,
+    inv_p: np.ndarray,
+    inv_q: np.ndarray,
+    transitions: bool,
+    trans_offsets: np.ndarray,
+    trans_alias_J: np.ndarray,
+    trans_alias_q: np.ndarray,
+    first_travel_alias_J: np.ndarray,
+    first_travel_alias_q: np.ndarray,
+    first_source: int,
+    last_source: int,
     cpu_num: int,
-    sampling_strategy: dict = None,
-    num_walks_key: str = None,
-    walk_length_key: str = None,
-    neighbors_key: str = None,
-    probabilities_key: str = None,
-    first_travel_key: str = None,
     quiet: bool = False
-) -> list:
-    """Generates the random walks which will be used as the skip-gram input.
+):
+    """Pre-computes the transition probabilities of a range of sources.
 
-    :return: List of walks. Each walk is a list of nodes.
+    Fills the alias tables owned by the sources in
+    `[first_source, last_source)` in place. See `precompute_probabilities`.
     """
-    walks = list()
-
-    if not quiet:
-        pbar = tqdm(total=num_walks,
-                    desc='Generating walks (CPU: {})'.format(cpu_num))
-
-    for n_walk in range(num_walks):
-
-        # Update progress bar
-        if not quiet:
-            pbar.update(1)
-
-        # Shuffle the nodes
-        shuffled_nodes = list(d_graph.keys())
-        random.shuffle(shuffled_nodes)
-
-        # Start a random walk from every node
-        for source in shuffled_nodes:
+    source_relation = np.zeros(len(indptr) - 1, dtype=np.uint8)
+    scratch = np.empty(np.diff(indptr).max(initial=0), dtype=np.float64)
 
-            # Skip nodes with specific num_walks
-            if source in sampling_strategy and \
-                    num_walks_key in sampling_strategy[source] and \
-                    sampling_strategy[source][num_walks_key] <= n_walk:
-                continue
+    # Update progress bar in blocks, the kernel processes a block at once
+    pbar = tqdm(total=last_source - first_source,
+                desc='Computing transition probabilities (CPU: {})'.format(
+                    cpu_num),
+                mininterval=1.0,
+                disable=quiet)
 
-            # Start walk
-            walk = [source]
+    for block_start in range(first_source, last_source, PROGRESS_INTERVAL):
+        block_end = min(block_start + PROGRESS_INTERVAL, last_source)
+        precompute_probabilities(indptr, indices, weights, inv_p, inv_q,
+                                 transitions, trans_offsets, trans_alias_J,
+                                 trans_alias_q, first_travel_alias_J,
+                                 first_travel_alias_q, block_start, block_end,
+                                 source_relation, scratch)
+        pbar.update(block_end - block_start)
 
-            # Calculate walk length
-            if source in sampling_strategy:
-                walk_length = sampling_strategy[source].get(walk_length_key,
-                                                            global_walk_length)
-            else:
-                walk_length = global_walk_length
+    pbar.close()
 
-            # Perform walk
-            while len(walk) < walk_length:
 
-                walk_options = d_graph[walk[-1]].get(neighbors_key, None)
-
-                # Skip dead end nodes
-                if not walk_options:
-                    break
-
-                if len(walk) == 1:  # For the first step
-                    probabilities = d_graph[walk[-1]][first_travel_key]
-                    walk_to = np.random.choice(walk_options, size=1,
-                                               p=probabilities)[0]
-                else:
-                    probabilities = (d_graph[walk[-1]]
-                                            [probabilities_key]
-                                            [walk[-2]])
-                    walk_to = np.random.choice(walk_options, size=1,
-                                               p=probabilities)[0]
-
-                walk.append(walk_to)
-
-            walk = list(map(str, walk))  # Convert all to strings
-
-            walks.append(walk)
+def parallel_generate_walks(
+    indptr: np.ndarray,
+    indices: np.ndarray,
+    weights: np.ndarray,
+    inv_p: np.ndarray,
+    inv_q: np.ndarray,
+    trans_offsets: np.ndarray,
+    trans_alias_J: np.ndarray,
+    trans_alias_q: np.ndarray,
+    first_travel_alias_J: np.ndarray,
+    first_travel_alias_q: np.ndarray,
+    uniform: bool,
+    precomputed: bool,
+    walk_length: np.ndarray,
+    num_walks: np.ndarray,
+    rounds: np.ndarray,
+    walks: np.ndarray,
+    seed: int
+):
+    """Generates the random walks which will be used as the skip-gram input.
 
-    if not quiet:
-        pbar.close()
+    Fills `walks`, the rows of the given rounds in the shared walks matrix,
+    in place. See `generate_walks`.
+    """
+    source_relation = np.zeros(len(indptr) - 1, dtype=np.uint8)
+    scratch = np.empty(np.diff(indptr).max(initial=0), dtype=np.float64)
 
-    return walks
+    generate_walks(indptr, indices, weights, inv_p, inv_q, trans_offsets,
+                   trans_alias_J, trans_alias_q, first_travel_alias_J,
+                   first_travel_alias_q, uniform, precomputed, walk_length,
+                   num_walks, rounds, seed, source_relation, scratch, walks)
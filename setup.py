@@ -15,7 +15,8 @@ setup(
         'gensim',
         'numpy',
         'tqdm',
-        'joblib>=0.13.2'
+        'joblib>=0.13.2',
+        'numba'
     ],
     keywords=['machine learning', 'embeddings'],
 )